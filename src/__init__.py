@@ -1,5 +1,6 @@
 from . import core
 from . import core_v1 as v1
 from . import io
-from .core import (EzRecordDataset, IndexedRecordDataset, IndexFile,
-                   make_dataset)
+from .core import (EzRecordDataset, IndexedRecordDataset,
+                   IndexedRecordDatasetV2, IndexFile, make_dataset,
+                   worker_init_fn)
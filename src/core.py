@@ -1,18 +1,35 @@
+import errno
+import mmap
 import os
 import struct
+import sys
 import warnings
-from copy import deepcopy
-from functools import cached_property
-from io import SEEK_CUR, SEEK_END
+import weakref
+from array import array
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import cached_property, lru_cache
+from io import SEEK_SET
+from itertools import accumulate, islice
 from pathlib import Path
 from shutil import move
 from typing import Callable, Dict, Iterable, List, Optional, Tuple, Union
 
+from .io import get_struct_fmt, is_buffer_loader
+
 # Reserve for whatever changes in the future
 RESERVED_SPACE = 1024
-RESERVED_BYTES = struct.pack("<" + "x" * RESERVED_SPACE)
+RESERVED_BYTES = bytes(RESERVED_SPACE)
 INDEX_SIZE = 8
 INDEX_FMT = "<Q"
+INDEX_STRUCT = struct.Struct(INDEX_FMT)
+# Buffer size for bulk sequential writes
+IO_BUFFER_SIZE = 1 << 20
+# Maximum number of buffers for a single writev
+IOV_MAX = 1024
+# Layout of the data file, stored in the first byte of the reserved space
+LAYOUT_INTERLEAVED = 0
+LAYOUT_SPLIT = 1
 
 
 def init_index_file(output_path: str):
@@ -29,21 +46,45 @@ def init_index_file(output_path: str):
     return output_path
 
 
-def init_data_file(output_path: Union[str, Path]):
+def init_data_file(output_path: Union[str, Path], layout: int = LAYOUT_INTERLEAVED):
     """Create an "empty" data file
 
     Args:
         output_path (Union[str, Path]):
             Path to output dataset file, must not exists.
+        layout (int):
+            Layout of the data file, `LAYOUT_INTERLEAVED` or `LAYOUT_SPLIT`.
+            Default: `LAYOUT_INTERLEAVED`.
     """
     msg = f"The file {output_path} already exists"
     assert not os.path.exists(output_path), msg
-    with open(output_path, "wb") as f:
-        f.write(RESERVED_BYTES)
+
+    # Reserve the space as a hole, the kernel does not have to write the zeros
+    fd = os.open(output_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+    try:
+        os.ftruncate(fd, RESERVED_SPACE)
+        if layout != LAYOUT_INTERLEAVED:
+            _pwrite(fd, bytes([layout]), 0)
+    finally:
+        os.close(fd)
     return output_path
 
 
-def init_dataset(dataset_path: str, index_path: Optional[str] = None):
+def read_layout(data_path: Union[str, Path]) -> int:
+    """Read the layout of a data file, see `init_data_file`.
+
+    Data files created before the layout was recorded are `LAYOUT_INTERLEAVED`.
+    """
+    with open(data_path, "rb") as io:
+        layout_bin = io.read(1)
+    return layout_bin[0] if len(layout_bin) > 0 else LAYOUT_INTERLEAVED
+
+
+def init_dataset(
+    dataset_path: str,
+    index_path: Optional[str] = None,
+    layout: int = LAYOUT_INTERLEAVED,
+):
     """Create an empty dataset, include one data file and one index file.
 
     Args:
@@ -54,6 +95,9 @@ def init_dataset(dataset_path: str, index_path: Optional[str] = None):
             If is set to `None`, it will be determined by replacing the extension of
             dataset path with `.idx`.
             Default: `None`.
+        layout (int):
+            Layout of the data file, see `init_data_file`.
+            Default: `LAYOUT_INTERLEAVED`.
     """
     # Default index file
     if index_path is None:
@@ -65,27 +109,121 @@ def init_dataset(dataset_path: str, index_path: Optional[str] = None):
 
     # Create empty files
     init_index_file(index_path)
-    init_data_file(dataset_path)
+    init_data_file(dataset_path, layout)
     return dataset_path, index_path
 
 
 def pack_index(idx: int) -> bytes:
     """Convert a UInt64 to bytes buffer"""
-    return struct.pack(INDEX_FMT, idx)
+    return INDEX_STRUCT.pack(idx)
 
 
-def pack_index(idx: int) -> bytes:
-    """Convert a UInt64 to bytes buffer"""
-    return struct.pack(INDEX_FMT, idx)
+def pack_indices(indices: List[int]) -> bytes:
+    """Convert a list of UInt64 to bytes buffer"""
+    indices_arr = array("Q", indices)
+    if sys.byteorder != "little":
+        indices_arr.byteswap()
+    return indices_arr.tobytes()
+
+
+def _swap_uint64(value: int) -> int:
+    """Reverse the byte order of a UInt64."""
+    return int.from_bytes(value.to_bytes(INDEX_SIZE, "little"), "big")
+
+
+class _ByteSwappedArray:
+    """UInt64 view of a little-endian buffer on a big-endian machine.
+
+    Single values are byteswapped on access, slices are returned as byteswapped copies.
+    """
+
+    def __init__(self, view: memoryview):
+        self._view = view
+
+    def __len__(self):
+        return len(self._view)
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            values = array("Q", self._view[idx])
+            values.byteswap()
+            return values
+        return _swap_uint64(self._view[idx])
+
+    def __setitem__(self, idx: int, value: int):
+        self._view[idx] = _swap_uint64(value)
+
+    def release(self):
+        self._view.release()
 
 
 def unpack_index(idx_bin: bytes) -> int:
     """Decode a bytes buffer as UInt64"""
-    return struct.unpack(INDEX_FMT, idx_bin)[0]
+    return INDEX_STRUCT.unpack(idx_bin)[0]
 
 
-def pack_data(items: Tuple, dumpers: List) -> bytes:
-    """Serialize data to bytes with header and such
+@lru_cache
+def _get_header_struct(n: int) -> struct.Struct:
+    """Return the compiled struct of a sample header.
+
+    Args:
+        n (int): Number of items in the sample.
+    """
+    return struct.Struct(f"<{n}Q")
+
+
+@lru_cache
+def _get_payload_struct(
+    loaders: Tuple,
+) -> Optional[Tuple[struct.Struct, Tuple[int, ...]]]:
+    """Return the compiled struct of the items of a sample, without the headers.
+
+    This only works if all the loaders are fixed-size scalar loaders,
+    see `io.get_struct_fmt`.
+
+    Args:
+        loaders (Tuple[Callable]): Tuple of deserialize functions.
+
+    Returns:
+        payload (Optional[Tuple[struct.Struct, Tuple[int]]]):
+            The items struct and the expected item sizes,
+            or `None` if one of the loaders is not supported.
+    """
+    fmts = [get_struct_fmt(loader) for loader in loaders]
+    if None in fmts:
+        return None
+    sizes = tuple(struct.calcsize(fmt) for fmt in fmts)
+    fmt = "".join(fmt.lstrip("<") for fmt in fmts)
+    return struct.Struct(f"<{fmt}"), sizes
+
+
+@lru_cache
+def _get_fused_struct(
+    loaders: Tuple,
+) -> Optional[Tuple[struct.Struct, Tuple[int, ...]]]:
+    """Return the compiled struct of a whole sample, headers included.
+
+    This only works if all the loaders are fixed-size scalar loaders,
+    see `io.get_struct_fmt`.
+
+    Args:
+        loaders (Tuple[Callable]): Tuple of deserialize functions.
+
+    Returns:
+        fused (Optional[Tuple[struct.Struct, Tuple[int]]]):
+            The sample struct and the expected item sizes,
+            or `None` if one of the loaders is not supported.
+    """
+    payload = _get_payload_struct(loaders)
+    if payload is None:
+        return None
+    payload_struct, sizes = payload
+    fmt = payload_struct.format.lstrip("<")
+    return struct.Struct(f"<{len(sizes)}Q{fmt}"), sizes
+
+
+def pack_data_parts(items: Tuple, dumpers: List) -> List[bytes]:
+    """Serialize data to a list of buffers, the packed headers then each of the items.
 
     Args:
         items (Tuple): Tuple of items.
@@ -93,11 +231,46 @@ def pack_data(items: Tuple, dumpers: List) -> bytes:
     """
     iter_ = enumerate(items)
     items_bin = [dumpers[i](item) for i, item in iter_]
-    headers = [pack_index(len(b)) for b in items_bin]
-    outputs = b"".join(headers + items_bin)
+    header_struct = _get_header_struct(len(items_bin))
+    headers_bin = header_struct.pack(*[len(b) for b in items_bin])
+    return [headers_bin, *items_bin]
+
+
+def pack_data(items: Tuple, dumpers: List) -> bytes:
+    """Serialize data to bytes with header and such
+
+    Args:
+        items (Tuple): Tuple of items.
+        dumpers (List[Callable]): List of serialize function.
+    """
+    outputs = b"".join(pack_data_parts(items, dumpers))
     return outputs
 
 
+def pwrite_parts(fd: int, parts: List[bytes], offset: int) -> int:
+    """Write a list of buffers at some offset of a file, with a single syscall if possible.
+
+    `os.pwritev` is used when possible, so that the buffers are not concatenated.
+    The file pointer is not used, so the same file descriptor can be shared between threads.
+
+    Args:
+        fd (int): The file descriptor.
+        parts (List[bytes]): The buffers to be written.
+        offset (int): The offset to write to.
+
+    Returns:
+        size (int): The number of written bytes.
+    """
+    size = sum(len(b) for b in parts)
+    written = 0
+    if hasattr(os, "pwritev") and len(parts) <= IOV_MAX:
+        written = os.pwritev(fd, parts, offset)
+    if written < size:
+        data_bin = b"".join(parts)
+        _pwrite(fd, memoryview(data_bin)[written:], offset + written)
+    return size
+
+
 def unpack_headers_(io, n: int) -> List[int]:
     """Unpack headers from data. This function change the file pointer.
 
@@ -105,7 +278,8 @@ def unpack_headers_(io, n: int) -> List[int]:
         io: The file object
         n (int): Number of header items
     """
-    return [unpack_index(io.read(INDEX_SIZE)) for i in range(n)]
+    header_struct = _get_header_struct(n)
+    return list(header_struct.unpack(io.read(header_struct.size)))
 
 
 def unpack_data_(io, headers: List[int], loaders: List):
@@ -116,10 +290,162 @@ def unpack_data_(io, headers: List[int], loaders: List):
         headers (List[int]): List of item size.
         loaders (List[Callable]): List of deserialize functions.
     """
-    items = [loaders[i](io.read(h)) for i, h in enumerate(headers)]
+    # Read the whole record body at once, then slice each item out of it
+    data_bin = io.read(sum(headers))
+    items = []
+    start = 0
+    for loader, size in zip(loaders, headers):
+        end = start + size
+        items.append(loader(data_bin[start:end]))
+        start = end
     return items
 
 
+def unpack_data_from(buffer, offset: int, headers: List[int], loaders: List):
+    """Deserialize data from a buffer (e.g. a memory map of the data file).
+
+    Loaders marked with `io.buffer_loader` receive zero-copy `memoryview` slices,
+    the other loaders receive `bytes`.
+
+    Args:
+        buffer: Any object supporting the buffer protocol.
+        offset (int): Offset of the first item (after the headers) in the buffer.
+        headers (List[int]): List of item size.
+        loaders (List[Callable]): List of deserialize functions.
+    """
+    view = memoryview(buffer)
+    items = []
+    start = offset
+    for loader, size in zip(loaders, headers):
+        end = start + size
+        data_bin = view[start:end]
+        if not is_buffer_loader(loader):
+            data_bin = data_bin.tobytes()
+        items.append(loader(data_bin))
+        start = end
+    return items
+
+
+def _copy_file_range(src_fd: int, dst_fd: int, offset: int, count: int) -> int:
+    return os.copy_file_range(src_fd, dst_fd, count, offset)
+
+
+def _sendfile(src_fd: int, dst_fd: int, offset: int, count: int) -> int:
+    return os.sendfile(dst_fd, src_fd, offset, count)
+
+
+def _read_write(src_fd: int, dst_fd: int, offset: int, count: int) -> int:
+    os.lseek(src_fd, offset, SEEK_SET)
+    return os.write(dst_fd, os.read(src_fd, min(count, 1 << 20)))
+
+
+# Copy methods, from the fastest to the most portable one
+_COPY_FNS = [
+    fn
+    for fn, name in [
+        (_copy_file_range, "copy_file_range"),
+        (_sendfile, "sendfile"),
+        (_read_write, "read"),
+    ]
+    if hasattr(os, name)
+]
+_COPY_UNSUPPORTED = {
+    errno.EXDEV,
+    errno.ENOSYS,
+    errno.EINVAL,
+    errno.EOPNOTSUPP,
+    errno.ENOTSOCK,
+}
+
+
+def copy_range_(src_fd: int, dst_fd: int, offset: int, size: int):
+    """Copy a byte range of a file to another file. This function change the file pointer.
+
+    The bytes are copied in kernel space when possible (`copy_file_range`, or `sendfile`),
+    they are written at the current position of the destination file.
+
+    Args:
+        src_fd (int): The source file descriptor.
+        dst_fd (int): The destination file descriptor.
+        offset (int): Offset of the range in the source file.
+        size (int): Size of the range.
+    """
+    start = offset
+    end = offset + size
+    for copy in _COPY_FNS:
+        try:
+            while offset < end:
+                count = copy(src_fd, dst_fd, offset, end - offset)
+                if count == 0:
+                    raise EOFError(f"Unexpected end of file at offset {offset}")
+                offset = offset + count
+            return
+        except OSError as e:
+            # Try the next method, unless some bytes were already copied
+            if e.errno not in _COPY_UNSUPPORTED or offset != start:
+                raise
+
+
+def merge_spans(
+    spans: Iterable[Tuple[int, int]],
+) -> Tuple[List[int], List[List[int]]]:
+    """Plan the copy of byte spans of a data file, one after another, right after the reserved space.
+
+    Contiguous spans are merged into bigger ranges, so that they are copied at once.
+
+    Args:
+        spans (Iterable[Tuple[int, int]]): The offset and the size of each span.
+
+    Returns:
+        offsets (List[int]): The new offset of each span.
+        ranges (List[List[int]]): The offset and the size of each range to be copied, see `copy_ranges`.
+    """
+    offsets = []
+    ranges = []
+    cursor = RESERVED_SPACE
+    for offset, size in spans:
+        offsets.append(cursor)
+        cursor = cursor + size
+        if len(ranges) > 0 and sum(ranges[-1]) == offset:
+            ranges[-1][1] = ranges[-1][1] + size
+        else:
+            ranges.append([offset, size])
+    return offsets, ranges
+
+
+def copy_ranges(src_path: str, dst_path: str, ranges: List[Tuple[int, int]]):
+    """Copy byte ranges of a data file, one after another, right after the reserved space of another data file.
+
+    Args:
+        src_path (str): The source data file.
+        dst_path (str): The destination data file.
+        ranges (List[Tuple[int, int]]): The offset and the size of each range.
+    """
+    flags = getattr(os, "O_BINARY", 0)
+    src_fd = os.open(src_path, os.O_RDONLY | flags)
+    dst_fd = os.open(dst_path, os.O_WRONLY | flags)
+    try:
+        os.lseek(dst_fd, RESERVED_SPACE, SEEK_SET)
+        for offset, size in ranges:
+            copy_range_(src_fd, dst_fd, offset, size)
+    finally:
+        os.close(src_fd)
+        os.close(dst_fd)
+
+
+def _pwrite(fd: int, data: bytes, offset: int):
+    """Write a buffer at some offset of a file, without the file pointer if possible."""
+    view = memoryview(data)
+    while len(view) > 0:
+        if hasattr(os, "pwrite"):
+            count = os.pwrite(fd, view, offset)
+        else:
+            os.lseek(fd, offset, SEEK_SET)
+            count = os.write(fd, view)
+        view = view[count:]
+        offset = offset + count
+
+
 class IndexFile:
     """File object to interact with index file.
 
@@ -137,6 +463,13 @@ class IndexFile:
 
     Attributes:
         path (str): Path to the physical index file.
+
+    !!! info "The index file is memory-mapped"
+        The whole index file is mapped into memory as an array of UInt64 for
+        the lifetime of the object, so lookups do not hit any syscall.
+        The file is mapped read-only until the first modification,
+        so that read-only index files can be used.
+        Use `close` to release the mapping early.
     """
 
     def __init__(self, path: str, create: bool = False):
@@ -147,6 +480,112 @@ class IndexFile:
             msg = f"The file {path} does not exists, to create a new one, use `create = true`"
             assert exists, msg
         self.path = path
+        self._fd = None
+        self._mm = None
+        self._arr = None
+        self._writable = False
+        self._map()
+
+    def _map(self):
+        """(Re)map the physical index file into memory.
+
+        This must be called whenever the file size changes,
+        or when the file on the disk is replaced.
+        """
+        self.close()
+        flags = os.O_RDWR if self._writable else os.O_RDONLY
+        self._fd = os.open(self.path, flags | getattr(os, "O_BINARY", 0))
+        self._size = os.fstat(self._fd).st_size
+        self._remap()
+        self._reload_length()
+
+    def _make_writable(self):
+        """Reopen the index file for writing, before the first modification."""
+        if not self._writable:
+            self._writable = True
+            self._map()
+
+    def _remap(self):
+        """Recreate the memory map with the current file size."""
+        self._unmap()
+        access = mmap.ACCESS_WRITE if self._writable else mmap.ACCESS_READ
+        self._mm = mmap.mmap(self._fd, 0, access=access)
+        self._arr = memoryview(self._mm).cast("Q")
+
+        # The on-disk format is little-endian, the array view is native
+        if sys.byteorder != "little":
+            self._arr = _ByteSwappedArray(self._arr)
+
+        # Lookups are random, do not read ahead
+        advice = getattr(mmap, "MADV_RANDOM", None)
+        if advice is not None:
+            self._mm.madvise(advice)
+
+    def _unmap(self):
+        if self._arr is not None:
+            self._arr.release()
+            self._arr = None
+        if self._mm is not None:
+            try:
+                self._mm.close()
+            except BufferError:
+                # Some views are still alive, the mapping will be
+                # released when they are garbage collected
+                pass
+            self._mm = None
+
+    def _get_array(self) -> memoryview:
+        """Return the UInt64 view of the index file.
+
+        New offsets are written to the file directly, the map is only
+        extended here, when the whole file is needed.
+        """
+        if len(self._mm) < self._size:
+            self._remap()
+        return self._arr
+
+    def _reload_length(self):
+        """Reload the cached length from the index file.
+
+        Call this if the index file is modified by another process or object.
+        Appends (`extend`) reload the length and the file size by themselves,
+        the other operations assume that this object is the only writer.
+        """
+        self._size = os.fstat(self._fd).st_size
+        self._n = self._get_array()[0]
+
+    def _set_length(self, n: int):
+        """Update the length in the index file and in the cache."""
+        self._arr[0] = n
+        self._n = n
+
+    def flush(self):
+        """Flush the changes of the index file to the disk."""
+        if self._mm is not None:
+            self._mm.flush()
+
+    def close(self):
+        """Unmap the index file and close the file descriptor."""
+        self._unmap()
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def __del__(self):
+        if hasattr(self, "_fd"):
+            self.close()
+
+    def __getstate__(self):
+        # Memory maps can not be pickled, they are recreated on unpickling
+        return {"path": self.path}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._fd = None
+        self._mm = None
+        self._arr = None
+        self._writable = False
+        self._map()
 
     def _get_index_offset(self, idx: int):
         """Get the offset of the data-offset in the index file
@@ -167,46 +606,35 @@ class IndexFile:
         Args:
             offsets (List[int]): List of offsets.
         """
+        # Truncating a mapped file is not safe, unmap first
+        self.close()
+        n = len(offsets)
         with open(self.path, "wb") as io:
-            n = len(offsets)
             io.write(pack_index(n))
-            for offset in offsets:
-                io.write(pack_index(offset))
+            io.write(pack_indices(offsets))
+        self._map()
 
     def __len__(self):
-        with open(self.path, "rb") as io:
-            io.seek(0)
-            n = unpack_index(io.read(INDEX_SIZE))
-        return n
+        return self._n
 
     def _remove_last(self, idx):
         n = len(self)
-        with open(self.path, "rb+") as f:
-            # Do not truncate the file because there are backswapped stuff
-            # Write zeros so that it is not included in the backswap
-            f.seek(self._get_index_offset(n - 1))
-            f.write(pack_index(0))
+        # Do not truncate the file because there are backswapped stuff
+        # Write zeros so that it is not included in the backswap
+        self._get_array()[n] = 0
 
-            # Just reduce length
-            f.seek(0)
-            f.write(pack_index(n - 1))
+        # Just reduce length
+        self._set_length(n - 1)
 
     def _remove_with_backswap(self, idx: int):
         n = len(self)
-        with open(self.path, "rb+") as f:
-            # | n | i_0 | i_1 | ... i_(n-2) >|< i_(n-1) |
-            back_offset = self._get_index_offset(n - 1)
-            f.seek(back_offset)
-            back_bin = f.read(INDEX_SIZE)
+        # | n | i_0 | i_1 | ... i_(n-2) >|< i_(n-1) |
+        # Swap
+        arr = self._get_array()
+        arr[idx + 1] = arr[n]
 
-            # Swap
-            cur_offset = self._get_index_offset(idx)
-            f.seek(cur_offset)
-            f.write(back_bin)
-
-            # Reduce length
-            f.seek(0)
-            f.write(pack_index(n - 1))
+        # Reduce length
+        self._set_length(n - 1)
 
     def remove_at(self, idx: int):
         """Remove data offset at some index.
@@ -220,12 +648,24 @@ class IndexFile:
         """
         n = len(self)
         assert idx < n and idx >= 0
+        self._make_writable()
         # TODO: remove with truncation
         if idx == n - 1:
             offset_bin = self._remove_last(idx)
         else:
             offset_bin = self._remove_with_backswap(idx)
 
+    @property
+    def offsets(self) -> memoryview:
+        """A zero-copy UInt64 view of all the offsets, in index order.
+
+        Use this for bulk operations instead of reading the offsets one by one.
+        On big-endian machines, this is a byteswapped copy (`array.array`) instead.
+        The view must not be kept after the index file is modified or closed,
+        convert it (e.g. with `tolist()` or `np.asarray`) if needed.
+        """
+        return self._get_array()[1 : self._n + 1]
+
     def get_backswap_offsets(self) -> Dict[int, int]:
         """Return list of offsets that are backswapped during deletion
 
@@ -235,20 +675,9 @@ class IndexFile:
                 and the values are the index of those offsets.
         """
         n = len(self)
-        offsets = []
-        with open(self.path, "rb") as f:
-            # Retrieve information
-            a = self._get_index_offset(n)
-            b = f.seek(0, SEEK_END)
-            num_removed = (b - a) // INDEX_SIZE
-            f.seek(a)
-
-            # Retrieve indices
-            for i in range(num_removed):
-                idx = n + i
-                offset = unpack_index(f.read(INDEX_SIZE))
-                if offset != 0:
-                    offsets.append(offset)
+        # Everything after the last index is backswapped, except the zeros
+        backswap = self._get_array()[n + 1 :].tolist()
+        offsets = [offset for offset in backswap if offset != 0]
         offsets = sorted(offsets)
         return offsets
 
@@ -262,41 +691,64 @@ class IndexFile:
                 If replace is true, the output file will be moved to the current index file
                 on the disk. Default: false.
         """
-        n = len(self)
-        bs_offsets = self.get_backswap_offsets()
+        offsets = self.offsets.tolist()
+        bs_offsets = set(self.get_backswap_offsets())
 
-        # Filter out deleted index
-        bs_maps = {offset: i for i, offset in enumerate(bs_offsets)}
-        bs_offsets = []
+        # Move back swapped offsets to the back, keep the others in place
+        kept = [offset for offset in offsets if offset not in bs_offsets]
+        moved = [offset for offset in offsets if offset in bs_offsets]
 
-        # Select which file to copy to
+        # Write to the new file at once
         new_file = IndexFile(output_file, create=True)
-        for i in range(n):
-            offset = self[i]
-            # Skip back swapped index
-            if offset in bs_maps:
-                bs_offsets.append(offset)
-                continue
-
-            # Add index
-            new_file.append(offset)
-
-        # Add backswapped offsets
-        for offset in bs_offsets:
-            new_file.append(offset)
+        new_file.write(kept + moved)
+
         # Replace
+        new_file.close()
         if replace:
+            # An open and mapped file can not be replaced on some platforms (Windows)
+            self.close()
             move(output_file, self.path)
+            self._map()
 
     def quick_remove_at(self, idx: int):
         """Deprecated, use `remove_at`"""
         self.remove_at(idx)
 
+    def _get_position(self, idx: int) -> int:
+        """Return the position of an index in the index array.
+
+        Negative indices count from the end. The bounds are checked
+        against the cached length, without reading the index file.
+
+        Raises:
+            IndexError: if the index is out of range.
+        """
+        n = self._n
+        if idx < 0:
+            idx = idx + n
+        if idx < 0 or idx >= n:
+            raise IndexError(f"Index {idx} is out of range for {n} items")
+        return idx + 1
+
     def __getitem__(self, idx):
-        with open(self.path, "rb") as io:
-            io.seek(self._get_index_offset(idx))
-            offset = unpack_index(io.read(INDEX_SIZE))
-        return offset
+        pos = self._get_position(idx)
+        try:
+            return self._arr[pos]
+        except IndexError:
+            return self._get_array()[pos]
+
+    def take(self, idxs: List[int]) -> List[int]:
+        """Get the offsets at multiple indices at once.
+
+        Args:
+            idxs (List[int]): The indices.
+
+        Returns:
+            offsets (List[int]): The offsets, in the same order as `idxs`.
+        """
+        arr = self._get_array()
+        get_position = self._get_position
+        return [arr[get_position(idx)] for idx in idxs]
 
     def __repr__(self):
         n = len(self)
@@ -310,25 +762,50 @@ class IndexFile:
         Args:
             offset (int): the offset to be added.
         """
+        self.extend([offset])
+
+    def extend(self, offsets: List[int]):
+        """Append a list of offsets to the index file at once.
+
+        This is much faster than calling `append` for each of the offsets.
+
+        Args:
+            offsets (List[int]): the offsets to be added.
+        """
+        k = len(offsets)
+        if k == 0:
+            return
+        self._make_writable()
+
+        # Other objects may have appended to the index file
+        self._reload_length()
         n = len(self)
-        mode = "wb" if n == 0 else "rb+"
-        with open(self.path, mode) as io:
-            # Increase length
-            io.seek(0)
-            io.write(pack_index(n + 1))
 
-            # Add index
-            io.seek(0, SEEK_END)
-            io.write(pack_index(offset))
+        # An empty index drops the backswapped stuff
+        if n == 0 and self._size > INDEX_SIZE:
+            os.ftruncate(self._fd, INDEX_SIZE)
+            self._size = INDEX_SIZE
+            self._remap()
+
+        # Write the indices to the end of the file, the map is extended lazily
+        offsets_bin = pack_indices(offsets)
+        _pwrite(self._fd, offsets_bin, self._size)
+        self._size = self._size + len(offsets_bin)
+
+        # Increase length
+        self._set_length(n + k)
 
     def __setitem__(self, i, v):
-        with open(self.path, "rb+") as f:
-            # Overwrite current offset
-            f.seek(self._get_index_offset(i))
-            f.write(pack_index(v))
+        # Overwrite current offset
+        pos = self._get_position(i)
+        self._make_writable()
+        try:
+            self._arr[pos] = v
+        except IndexError:
+            self._get_array()[pos] = v
 
     def __iter__(self):
-        return (self[i] for i in range(len(self)))
+        return iter(self.offsets.tolist())
 
 
 def make_dataset(
@@ -337,23 +814,58 @@ def make_dataset(
     dumpers: List,
     index_path: Optional[str] = None,
 ):
-    indices = []
-    data = IndexedRecordDataset(
-        output,
-        index_path,
-        create=True,
-        dumpers=dumpers,
-    )
-    # Write record file
-    for items in record_iters:
-        data.append(items)
+    data_path, index_path = init_dataset(output, index_path)
+
+    # Write record file through a large buffer
+    offsets = []
+    offset = RESERVED_SPACE
+    with open(data_path, "ab", buffering=IO_BUFFER_SIZE) as io:
+        for items in record_iters:
+            parts = pack_data_parts(items, dumpers)
+            offsets.append(offset)
+            io.writelines(parts)
+            offset = offset + sum(len(b) for b in parts)
+
+    # Write the index at once
+    index = IndexFile(index_path)
+    index.extend(offsets)
+    index.close()
 
     # Return the paths
-    data_path = data.path
-    index_path = data.index.path
     return data_path, index_path
 
 
+# Datasets whose handles are reset in forked processes
+_OPEN_DATASETS = weakref.WeakSet()
+
+
+def _reset_after_fork():
+    """Reset the memory maps and file handles of every dataset in a forked process."""
+    for dataset in list(_OPEN_DATASETS):
+        dataset._reset_handles()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def worker_init_fn(worker_id: int):
+    """Reset the memory maps and file handles of the datasets in a data loading worker.
+
+    Forked processes are handled automatically, this function is for the worker
+    processes that are not created with `os.fork`, or for explicitness.
+
+    Example:
+        ```python
+        loader = DataLoader(dataset, num_workers=4, worker_init_fn=worker_init_fn)
+        ```
+
+    Args:
+        worker_id (int): The worker id, not used.
+    """
+    _reset_after_fork()
+
+
 class IndexedRecordDataset:
     """Wrapper object to work with record and index files.
 
@@ -381,6 +893,8 @@ class IndexedRecordDataset:
             Defaut: false.
     """
 
+    layout = LAYOUT_INTERLEAVED
+
     def __init__(
         self,
         path: str,
@@ -395,16 +909,27 @@ class IndexedRecordDataset:
         if index_path is None:
             index_path = os.path.splitext(path)[0] + ".idx"
         if create:
-            init_dataset(path, index_path)
+            init_dataset(path, index_path, self.layout)
         else:
             msg = f"Data file {path} does not exist, use `create = True` to create one"
             assert os.path.exists(path), msg
+            msg = f"Data file {path} has a different layout, use {self.__class__.__name__} with the right layout"
+            assert read_layout(path) == self.layout, msg
         self.path = path
         self.loaders = loaders
         self.dumpers = dumpers
         self.index = IndexFile(index_path)
         self.transform = transform
 
+        # Memory map of the data file and the write handle, opened lazily
+        self._mm = None
+        self._wio = None
+
+        # Sample reader of the last used loaders, see `_get_reader`
+        self._reader = None
+        self._reader_key = None
+        _OPEN_DATASETS.add(self)
+
         # +---------------------+
         # | Deprecation warning |
         # +---------------------+
@@ -432,11 +957,215 @@ class IndexedRecordDataset:
     serializers = property(get_serializers, set_serializers)
     deserializers = property(get_deserializers, set_deserializers)
 
+    def _get_map(self, size: int = 0) -> mmap.mmap:
+        """Return a read-only memory map of the data file.
+
+        The file is remapped if the current map is shorter than `size`,
+        e.g. after new samples are appended.
+
+        Args:
+            size (int): The minimum size that the map must cover.
+        """
+        mm = self._mm
+        if mm is None or len(mm) < size:
+            with open(self.path, "rb") as io:
+                mm = mmap.mmap(io.fileno(), 0, access=mmap.ACCESS_READ)
+            self._mm = mm
+            self._advise("MADV_RANDOM")
+        return mm
+
+    def _advise(self, name: str):
+        """Give the kernel an access pattern hint on the data file map, if supported.
+
+        Args:
+            name (str): Name of the `mmap.MADV_*` constant.
+        """
+        advice = getattr(mmap, name, None)
+        if advice is not None and self._mm is not None:
+            self._mm.madvise(advice)
+
+    def _read_headers(self, offset: int) -> Tuple[mmap.mmap, Tuple[int, ...]]:
+        """Read the headers of the sample at some offset.
+
+        Returns:
+            mm (mmap.mmap): The data file map, which covers the whole sample.
+            headers (Tuple[int]): Tuple of item size.
+        """
+        header_struct = self._header_struct
+        start = offset + header_struct.size
+        lens = header_struct.unpack_from(self._get_map(start), offset)
+        mm = self._get_map(start + sum(lens))
+        return mm, lens
+
+    def _get_reader(self, loaders: List) -> Callable[[int], List]:
+        """Return a function that reads and deserializes the sample at some offset.
+
+        Everything that does not depend on the offset (fused struct, header struct,
+        whether the loaders need a copy) is resolved once, so that the returned
+        function does as little work as possible per sample.
+        When all the loaders are fixed-size scalar loaders, the whole sample
+        is decoded with a single `struct` call, see `_get_decoder`.
+
+        Args:
+            loaders (List[Callable]): List of deserialize functions.
+        """
+        get_map = self._get_map
+        locate = self._get_locator()
+        copies = [not is_buffer_loader(loader) for loader in loaders]
+        steps = list(zip(loaders, copies))
+
+        def read_generic(key: int) -> List:
+            bounds = locate(key)
+            view = memoryview(get_map(bounds[-1]))
+            items = []
+            for (loader, copy), start, end in zip(steps, bounds, bounds[1:]):
+                data_bin = view[start:end]
+                items.append(loader(data_bin.tobytes() if copy else data_bin))
+            return items
+
+        try:
+            decode = self._get_decoder(tuple(loaders))
+        except TypeError:
+            # Unhashable loaders
+            decode = None
+        if decode is None:
+            return read_generic
+
+        def read_fused(key: int) -> List:
+            values = decode(key)
+            if values is None:
+                # The sample does not match the loaders
+                return read_generic(key)
+            return values
+
+        return read_fused
+
+    def _get_locator(self) -> Callable[[int], List[int]]:
+        """Return a function that returns the item boundaries of the sample at some offset.
+
+        Item `j` spans `[bounds[j], bounds[j + 1])` in the data file.
+        """
+        get_map = self._get_map
+        header_struct = self._header_struct
+        header_size = header_struct.size
+        unpack_headers = header_struct.unpack_from
+
+        def locate(offset: int) -> List[int]:
+            start = offset + header_size
+            lens = unpack_headers(get_map(start), offset)
+            return list(accumulate(lens, initial=start))
+
+        return locate
+
+    def _get_decoder(self, loaders: Tuple) -> Optional[Callable[[int], List]]:
+        """Return a function that decodes the sample at some offset with a single `struct` call.
+
+        The function returns `None` if the sample does not match the loaders.
+
+        Returns:
+            decode (Optional[Callable]):
+                The decode function, or `None` if the loaders are not all fixed-size scalar loaders.
+        """
+        fused = _get_fused_struct(loaders)
+        if fused is None:
+            return None
+
+        get_map = self._get_map
+        fused_struct, sizes = fused
+        fused_size = fused_struct.size
+        unpack_fused = fused_struct.unpack_from
+        N = len(sizes)
+
+        def decode(offset: int) -> Optional[List]:
+            values = unpack_fused(get_map(offset + fused_size), offset)
+            if values[:N] == sizes:
+                return list(values[N:])
+            return None
+
+        return decode
+
+    def _read_sample(self, offset: int, loaders: List) -> List:
+        """Read and deserialize the sample at some offset, see `_get_reader`."""
+        key = tuple(loaders)
+        if key != self._reader_key:
+            self._reader = self._get_reader(loaders)
+            self._reader_key = key
+        return self._reader(offset)
+
+    def _get_writer(self):
+        """Return the write handle of the data file, used by `append` and `__setitem__`.
+
+        The handle is unbuffered so that written samples are
+        immediately visible to the readers.
+        """
+        if self._wio is None:
+            self._wio = open(self.path, "r+b", buffering=0)
+        return self._wio
+
+    def flush(self):
+        """Flush pending writes to the data file and the index file."""
+        if self._wio is not None:
+            self._wio.flush()
+        self.index.flush()
+
+    def close(self):
+        """Unmap the data file, close the opened file handles and the index file."""
+        if self._mm is not None:
+            try:
+                self._mm.close()
+            except BufferError:
+                # Some views are still alive, the map will be
+                # released when they are garbage collected
+                pass
+            self._mm = None
+        if self._wio is not None:
+            self._wio.close()
+            self._wio = None
+        self.index.close()
+
+    def __del__(self):
+        if getattr(self, "_wio", None) is not None:
+            self._wio.close()
+
+    def __getstate__(self):
+        # Memory maps and file handles can not be pickled (e.g. for DataLoader workers),
+        # they are reopened lazily after unpickling
+        state = self.__dict__.copy()
+        state.pop("_mm")
+        state.pop("_wio")
+        state.pop("_reader")
+        state.pop("_reader_key")
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._reset_handles()
+        _OPEN_DATASETS.add(self)
+
+    def _reset_handles(self):
+        """Drop the memory map, the write handle and the cached states that depend on them.
+
+        They are reopened lazily. This is done in forked processes (e.g. DataLoader workers),
+        so that each process maps the data file by itself.
+        """
+        self._mm = None
+        self._wio = None
+        self._reader = None
+        self._reader_key = None
+
     @cached_property
     def num_items(self):
         """Number of items in each data sample."""
         return len(self.loaders)
 
+    @property
+    def _header_struct(self) -> struct.Struct:
+        """The compiled struct of the sample headers, cached by `_get_header_struct`.
+
+        This is not stored on the instance, `struct.Struct` objects can not be pickled.
+        """
+        return _get_header_struct(self.num_items)
+
     def quick_remove_at(self, idx):
         """Just a wrapper for `IndexFile.remove_at`."""
         self.index.remove_at(idx)
@@ -451,31 +1180,76 @@ class IndexedRecordDataset:
         !!! info "Defrag does not sort the index file"
             The `defrag` operation use the order inside the index file, so the index will not be sorted.
         """
-        ref_data = deepcopy(self)
-        ref_data.loaders = [lambda x: x for _ in self.loaders]
-        dumpers = [lambda x: x for _ in self.loaders]
+        data_path, index_path = init_dataset(output_file, layout=self.layout)
+
+        # Compute the new offsets, merge contiguous samples into bigger ranges
+        offsets, ranges = merge_spans(self._iter_spans())
+
+        # Copy the samples verbatim, no need to deserialize them
+        copy_ranges(self.path, data_path, ranges)
+        self._write_defrag_index(data_path, index_path, offsets)
+        return data_path, index_path
+
+    def _write_defrag_index(self, data_path: str, index_path: str, offsets: List[int]):
+        """Write the index of a defragmented dataset, see `defrag`.
 
-        def data_iter():
-            for item in ref_data:
-                yield item
+        Args:
+            data_path (str): The new data file.
+            index_path (str): The new index file.
+            offsets (List[int]): The new offset of each sample, in index order.
+        """
+        index = IndexFile(index_path)
+        index.extend(offsets)
+        index.close()
 
-        return make_dataset(data_iter(), output_file, dumpers=dumpers)
+    def _iter_spans(self):
+        """Iterate through the offset and the size (headers included) of each sample."""
+        N = self.num_items
+        for offset in self.index:
+            _, lens = self._read_headers(offset)
+            yield offset, INDEX_SIZE * N + sum(lens)
 
     def __iter__(self):
         """Iterate through this dataset"""
-        # first_offset = self.index[0]
-        # length = len(self)
-        # loaders = self.loaders
-        # N = self.num_items
-        # with open(self.path, "rb") as io:
-        #     io.seek(first_offset)
-        #     for _ in range(length):
-        #         lens = [unpack_index(io.read(INDEX_SIZE)) for _ in range(N)]
-        #         items = [loaders[i](io.read(n)) for i, n in enumerate(lens)]
-        #         yield items
-        # <- Not thread safe
-        N = len(self)
-        return (self[i] for i in range(N))
+        loaders = self.loaders
+        # Sequential read ahead, and start reading the file right away
+        self._get_map()
+        self._advise("MADV_SEQUENTIAL")
+        self._advise("MADV_WILLNEED")
+        try:
+            read_sample = self._get_reader(loaders)
+            for offset in self.index:
+                yield read_sample(offset)
+        finally:
+            self._advise("MADV_RANDOM")
+
+    def iter_prefetch(self, num_workers: int = 2, prefetch: int = 4):
+        """Iterate through this dataset, loading the next samples in background threads.
+
+        This overlaps reading and deserializing with the consumer's work,
+        it helps the most with loaders that release the GIL, such as image decoders.
+        The samples are yielded in order.
+
+        Args:
+            num_workers (int): Number of loading threads. Default: 2.
+            prefetch (int): Number of samples to be loaded ahead. Default: 4.
+        """
+        read_sample = self._get_reader(self.loaders)
+        offsets = iter(self.index)
+        executor = ThreadPoolExecutor(num_workers)
+        try:
+            # Keep `prefetch` samples in flight
+            futures = deque(
+                executor.submit(read_sample, offset)
+                for offset in islice(offsets, max(prefetch, 1))
+            )
+            while len(futures) > 0:
+                sample = futures.popleft().result()
+                for offset in islice(offsets, 1):
+                    futures.append(executor.submit(read_sample, offset))
+                yield sample
+        finally:
+            executor.shutdown(cancel_futures=True)
 
     def __len__(self):
         return len(self.index)
@@ -497,10 +1271,7 @@ class IndexedRecordDataset:
             # | Full row data |
             # +---------------+
             offset = self.index[idx]
-            with open(self.path, "rb") as io:
-                io.seek(offset)
-                lens = unpack_headers_(io, N)
-                items = unpack_data_(io, lens, self.loaders)
+            items = self._read_sample(offset, loaders)
             return items
         else:
             # +-----------------------------+
@@ -508,16 +1279,29 @@ class IndexedRecordDataset:
             # +-----------------------------+
             row_idx, col_idx = idx
             offset = self.index[row_idx]
-            with open(self.path, "rb") as io:
-                io.seek(offset)
-                lens = unpack_headers_(io, N)
-                i = 0
-                for i in range(col_idx):
-                    io.read(lens[i])
-                data_bin = io.read(lens[col_idx])
-                data = loaders[col_idx](data_bin)
+            mm, lens = self._read_headers(offset)
+            start = offset + INDEX_SIZE * N + sum(lens[:col_idx])
+            size = lens[col_idx]
+            data = unpack_data_from(mm, start, [size], [loaders[col_idx]])[0]
             return data
 
+    def __getitems__(self, idxs: List[int]) -> List:
+        """Get a batch of data samples.
+
+        The offsets are gathered from the index at once, and the samples
+        are read from the data file map.
+        PyTorch's `DataLoader` uses this method, if available, instead of
+        calling `__getitem__` for each sample of the batch.
+
+        Args:
+            idxs (List[int]): The sample indices.
+
+        Returns:
+            samples (List): The data samples, in the same order as `idxs`.
+        """
+        read_sample = self._get_reader(self.loaders)
+        return [read_sample(offset) for offset in self.index.take(idxs)]
+
     def __setitem__(self, k, v):
         """Update data sample at some index.
 
@@ -531,7 +1315,9 @@ class IndexedRecordDataset:
         # +---------+
         # | Prepare |
         # +---------+
-        last_bytes = os.path.getsize(self.path)
+        # Other objects may have written to the file, always check its size
+        fd = self._get_writer().fileno()
+        last_bytes = os.fstat(fd).st_size
         offset = self.index[k]
         N = self.num_items
         update_bin = pack_data(v, self.dumpers)
@@ -540,64 +1326,270 @@ class IndexedRecordDataset:
         # +------------------------------------------------+
         # | Case1: The update is smaller than current data |
         # +------------------------------------------------+
-        def case_inplace(io):
+        def case_inplace(fd):
             # print("Case inplace")
-            io.seek(offset)
-            io.write(update_bin)
+            _pwrite(fd, update_bin, offset)
 
         # +-------------------------------+
         # | Case2: The item is at the end |
         # +-------------------------------+
-        def case_truncate(io):
-            # print("Case truncate")
-            io.seek(offset)
-            io.truncate()
-            io.write(update_bin)
+        def case_at_end(fd):
+            # Do not truncate: accessing a live view (e.g. from `io.load_view`)
+            # past the end of a shrunk file crashes the process with SIGBUS.
+            # The stale tail is left in place, `defrag` drops it.
+            _pwrite(fd, update_bin, offset)
 
         # +--------------------------------+
         # | Case 3: Generic, append to end |
         # +--------------------------------+
-        def case_fallback(io):
+        def case_fallback(fd):
             # print("Case fallback")
-            io.seek(0, SEEK_END)
-            new_offset = io.tell()
-            io.write(update_bin)
+            new_offset = last_bytes
+            _pwrite(fd, update_bin, new_offset)
             self.index[k] = new_offset
 
-        with open(self.path, "rb+") as io:
-            # +--------------------------------------------+
-            # | Calculate total size, including the header |
-            # +--------------------------------------------+
-            io.seek(offset)
-            headers = unpack_headers_(io, N)
-            data_size = sum(headers) + INDEX_SIZE * N
-
-            # +-------------------------------------------------------+
-            # | Handle cases, the case when the item is at the end    |
-            # | shoud have higher priority since it does not fragment |
-            # | the data                                              |
-            # +-------------------------------------------------------+
-            if offset + data_size >= last_bytes:
-                case_truncate(io)
-            elif update_size <= data_size:
-                case_inplace(io)
-            else:
-                case_fallback(io)
-
-    def append(self, items: Tuple):
+        # +--------------------------------------------+
+        # | Calculate total size, including the header |
+        # +--------------------------------------------+
+        _, headers = self._read_headers(offset)
+        data_size = sum(headers) + INDEX_SIZE * N
+
+        # +-------------------------------------------------------+
+        # | Handle cases, the case when the item is at the end    |
+        # | shoud have higher priority since it does not fragment |
+        # | the data                                              |
+        # +-------------------------------------------------------+
+        if offset + data_size >= last_bytes:
+            case_at_end(fd)
+        elif update_size <= data_size:
+            case_inplace(fd)
+        else:
+            case_fallback(fd)
+
+    def append(self, items: Tuple, batch: bool = False) -> int:
         """Append new items to the dataset.
 
         Serializers are required for appending new items.
 
         Args:
             items (Tuple): A single data sample.
+            batch (bool):
+                If true, the index file is not updated, the caller is responsible for
+                adding the returned offset later, e.g. with `IndexFile.extend`.
+                Default: false.
+
+        Returns:
+            offset (int): The offset of the new sample in the data file.
+        """
+        offset = self._write_at_end(pack_data_parts(items, self.dumpers))
+        if not batch:
+            self.index.append(offset)
+        return offset
+
+    def _write_at_end(self, parts: List[bytes]) -> int:
+        """Write a list of buffers at the end of the data file.
+
+        The end of the file is checked on each call, so that several objects
+        can append to the same dataset one after another.
+
+        Returns:
+            offset (int): The offset of the first buffer in the data file.
+        """
+        fd = self._get_writer().fileno()
+        offset = os.fstat(fd).st_size
+        pwrite_parts(fd, parts, offset)
+        return offset
+
+
+class IndexedRecordDatasetV2(IndexedRecordDataset):
+    """Dataset with the item sizes stored apart from the items, in a header file.
+
+    The data file only stores the serialized items, and the header file (`.hdr`) stores
+    the item boundaries of every sample, as a matrix with `N + 1` UInt64 columns.
+    The index file stores the row numbers of this matrix instead of data offsets.
+    Locating an item (e.g. `data[i, j]`) only takes two loads from the header map,
+    without reading the headers of the other items from the data file.
+
+    This layout is opt-in, it is recorded in the reserved space of the data file,
+    so that a dataset can not be opened with the wrong class.
+    See `IndexedRecordDataset` for the other attributes.
+
+    Attributes:
+        header_path (str):
+            Path to the header file, will be guessed from `path`.
+            Default: `None`.
+    """
+
+    layout = LAYOUT_SPLIT
+
+    def __init__(
+        self,
+        path: str,
+        loaders: Optional[List] = None,
+        dumpers: Optional[List] = None,
+        index_path: Optional[str] = None,
+        header_path: Optional[str] = None,
+        create: bool = False,
+        transform: Optional[Callable] = None,
+    ):
+        if header_path is None:
+            header_path = os.path.splitext(path)[0] + ".hdr"
+        if create:
+            # Check before creating the other files, so that nothing is left behind
+            msg = f"The file {header_path} already exists"
+            assert not os.path.exists(header_path), msg
+        super().__init__(
+            path,
+            loaders=loaders,
+            dumpers=dumpers,
+            index_path=index_path,
+            create=create,
+            transform=transform,
+        )
+        self.header_path = header_path
+        self.headers = IndexFile(header_path, create=create)
+
+    @cached_property
+    def _row_size(self) -> int:
+        """Number of boundaries in each row of the header matrix."""
+        return self.num_items + 1
+
+    def _get_row(self, row: int) -> List[int]:
+        """Return the item boundaries of the sample at some row of the header matrix."""
+        start = row * self._row_size + 1
+        return self.headers._get_array()[start : start + self._row_size].tolist()
+
+    def _get_locator(self) -> Callable[[int], List[int]]:
+        """Return a function that returns the item boundaries of the sample at some row."""
+        return self._get_row
+
+    def _get_decoder(self, loaders: Tuple) -> Optional[Callable[[int], List]]:
+        """Return a function that decodes the sample at some row with a single `struct` call.
+
+        See `IndexedRecordDataset._get_decoder`.
+        """
+        payload = _get_payload_struct(loaders)
+        if payload is None:
+            return None
+
+        get_map = self._get_map
+        get_row = self._get_row
+        payload_struct, sizes = payload
+        sizes = list(sizes)
+        unpack_payload = payload_struct.unpack_from
+
+        def decode(row: int) -> Optional[List]:
+            bounds = get_row(row)
+            widths = [b - a for a, b in zip(bounds, bounds[1:])]
+            if widths == sizes:
+                return list(unpack_payload(get_map(bounds[-1]), bounds[0]))
+            return None
+
+        return decode
+
+    def __getitem__(self, idx: int):
+        """Get data item"""
+        if isinstance(idx, int):
+            return super().__getitem__(idx)
+
+        # +-----------------------------+
+        # | Partial mode, single column |
+        # +-----------------------------+
+        row_idx, col_idx = idx
+        row = self.index[row_idx]
+        # Normalize negative columns, this also checks the bounds
+        col_idx = range(self.num_items)[col_idx]
+        pos = row * self._row_size + col_idx + 1
+        bounds = self.headers._get_array()
+        start, end = bounds[pos], bounds[pos + 1]
+        mm = self._get_map(end)
+        loader = self.loaders[col_idx]
+        return unpack_data_from(mm, start, [end - start], [loader])[0]
+
+    def __setitem__(self, k, v):
+        """Update data sample at some index.
+
+        When the update is not larger than the current data, the data is overwritten
+        in place, otherwise the update is appended to the dataset.
+        """
+        row = self.index[k]
+        bounds = self._get_row(row)
+        parts = [dumper(item) for dumper, item in zip(self.dumpers, v)]
+        if sum(len(b) for b in parts) > bounds[-1] - bounds[0]:
+            self.index[k] = self.append(v, batch=True)
+            return
+
+        # Overwrite in place, then update the boundaries
+        pwrite_parts(self._get_writer().fileno(), parts, bounds[0])
+        start = row * self._row_size
+        for i, bound in enumerate(self._get_bounds(bounds[0], parts)):
+            self.headers[start + i] = bound
+
+    @staticmethod
+    def _get_bounds(offset: int, parts: List[bytes]) -> List[int]:
+        """Return the boundaries of the items written at some offset."""
+        bounds = [offset]
+        for data_bin in parts:
+            bounds.append(bounds[-1] + len(data_bin))
+        return bounds
+
+    def append(self, items: Tuple, batch: bool = False) -> int:
+        """Append new items to the dataset.
+
+        Serializers are required for appending new items.
+
+        Args:
+            items (Tuple): A single data sample.
+            batch (bool):
+                If true, the index file is not updated, the caller is responsible for
+                adding the returned row later, e.g. with `IndexFile.extend`.
+                Default: false.
+
+        Returns:
+            row (int): The row of the new sample in the header matrix.
+        """
+        parts = [dumper(item) for dumper, item in zip(self.dumpers, items)]
+        offset = self._write_at_end(parts)
+        row = len(self.headers) // self._row_size
+        self.headers.extend(self._get_bounds(offset, parts))
+        if not batch:
+            self.index.append(row)
+        return row
+
+    def _iter_spans(self):
+        """Iterate through the offset and the size of the items of each sample."""
+        for row in self.index:
+            bounds = self._get_row(row)
+            yield bounds[0], bounds[-1] - bounds[0]
+
+    def _write_defrag_index(self, data_path: str, index_path: str, offsets: List[int]):
+        """Write the index and the header file of a defragmented dataset.
+
+        The header matrix of the new dataset only has the rows of the indexed samples,
+        in the order of the index file.
         """
-        data_bin = pack_data(items, self.dumpers)
-        with open(self.path, "a+b") as io:
-            io.seek(0, SEEK_END)
-            idx = io.tell()
-            self.index.append(idx)
-            io.write(data_bin)
+        boundaries = []
+        for row, new_offset in zip(self.index, offsets):
+            bounds = self._get_row(row)
+            boundaries.extend(bound - bounds[0] + new_offset for bound in bounds)
+
+        header_path = os.path.splitext(data_path)[0] + ".hdr"
+        headers = IndexFile(header_path, create=True)
+        headers.extend(boundaries)
+        headers.close()
+        index = IndexFile(index_path)
+        index.extend(range(len(offsets)))
+        index.close()
+
+    def flush(self):
+        """Flush pending writes to the data file, the index file and the header file."""
+        super().flush()
+        self.headers.flush()
+
+    def close(self):
+        """Unmap the data file, close the opened file handles, the index file and the header file."""
+        super().close()
+        self.headers.close()
 
 
 class EzRecordDataset(IndexedRecordDataset):
@@ -1,8 +1,15 @@
+import struct
+import sys
 from abc import ABC, abstractmethod
-from typing import Generic, Iterable, Sequence, TypeVar
+from array import array
+from typing import Generic, Iterable, List, Sequence, Tuple, TypeVar
 
 T = TypeVar("T")
 
+# Binary index file: the magic bytes, then for each record,
+# the number of items `k`, the record offset and the `k` item sizes (UInt64)
+INDEX_MAGIC = b"DSRIDXV1"
+
 
 class RecordFormat(ABC, Generic[T]):
     @abstractmethod
@@ -23,26 +30,72 @@ def make_dataset(
     indices = []
 
     # Write record file
+    offset = 0
     with open(record_file, "wb") as io:
         for record in record_iters:
             # serialize
             record_bin = record_format.serialize(record)
 
             # Track global offset, local offset (size)
-            record_offsets = [io.tell()]
-            for b in record_bin:
-                io.write(b)
-                offset = io.tell() - sum(record_offsets)
-                record_offsets.append(offset)
-            indices.append(record_offsets)
+            sizes = [len(b) for b in record_bin]
+            indices.append([offset, *sizes])
+            io.write(b"".join(record_bin))
+            offset = offset + sum(sizes)
 
     # Write indice files
-    indice_strs = [",".join(map(str, idx)) for idx in indices]
-    with open(index_file, "w", encoding="utf-8") as io:
-        io.write("\n".join(indice_strs))
+    # Every record of a format has the same number of items, compile the row struct once
+    row_structs = {}
+    indice_bins = []
+    for idx in indices:
+        n = len(idx)
+        if n not in row_structs:
+            row_structs[n] = struct.Struct(f"<Q{n}Q")
+        indice_bins.append(row_structs[n].pack(n - 1, *idx))
+    with open(index_file, "wb") as io:
+        io.write(INDEX_MAGIC + b"".join(indice_bins))
     return record_file, index_file
 
 
+def read_index(index_file: str) -> List[Tuple[int, ...]]:
+    """Read the offsets and sizes of every record from an index file.
+
+    Old text index files are also supported.
+
+    Args:
+        index_file (str): Path to the index file.
+    """
+    with open(index_file, "rb") as io:
+        index_bin = io.read()
+    if not index_bin.startswith(INDEX_MAGIC):
+        return read_text_index(index_file)
+
+    # Walk through the records with a cursor
+    values = array("Q", index_bin[len(INDEX_MAGIC) :])
+    if sys.byteorder != "little":
+        values.byteswap()
+    offsets = []
+    cursor = 0
+    while cursor < len(values):
+        k = values[cursor]
+        offsets.append(tuple(values[cursor + 1 : cursor + k + 2]))
+        cursor = cursor + k + 2
+    return offsets
+
+
+def read_text_index(index_file: str) -> List[Tuple[int, ...]]:
+    """Read an old text index file (one comma-separated record per line).
+
+    Args:
+        index_file (str): Path to the index file.
+    """
+    with open(index_file, encoding="utf-8") as io:
+        lines = io.readlines()
+        lines = [line.strip() for line in lines]
+        lines = [line for line in lines if len(line) > 0]
+        offsets = [tuple(int(i) for i in line.split(",")) for line in lines]
+    return offsets
+
+
 class EzRecordDataset:
     def __init__(
         self,
@@ -56,12 +109,7 @@ class EzRecordDataset:
         self.fmt = record_format
 
         # Read index file
-        with open(index_file, encoding="utf-8") as io:
-            lines = io.readlines()
-            lines = [line.strip() for line in lines]
-            lines = [line for line in lines if len(line) > 0]
-            offsets = [tuple(int(i) for i in line.split(",")) for line in lines]
-        self.offsets = offsets
+        self.offsets = read_index(index_file)
 
     def __len__(self):
         return len(self.offsets)
@@ -4,6 +4,8 @@ Attributes:
     NO_INPUT (object):
         Immortal one-time object that is used by the `kurry` function to indicate there is no input.
 """
+
+import inspect
 import struct
 import warnings
 from functools import lru_cache, partial, wraps
@@ -47,6 +49,37 @@ def _get_float_fmt(bits: int) -> str:
     return f"<{fmt}"
 
 
+@lru_cache
+def _get_int_struct(bits: int, signed: bool) -> struct.Struct:
+    """Return the compiled `struct.Struct` of an integer type, see `_get_int_fmt`."""
+    return struct.Struct(_get_int_fmt(bits, signed))
+
+
+@lru_cache
+def _get_float_struct(bits: int) -> struct.Struct:
+    """Return the compiled `struct.Struct` of a float type, see `_get_float_fmt`."""
+    return struct.Struct(_get_float_fmt(bits))
+
+
+_BOOL_STRUCT = struct.Struct("<?")
+_LIST_HEADER_STRUCT = struct.Struct("<L")
+# dtype string, number of dimensions, up to 8 dimension sizes
+_NP_RAW_HEADER_STRUCT = struct.Struct("<16sB8Q")
+_NP_RAW_MAX_DIMS = 8
+
+
+def _get_int_dtype(bits: int, signed: bool) -> str:
+    """Return the little-endian numpy dtype of an integer type.
+
+    Args:
+        bits (int): The number bitness of the type, should be one of `8, 16, 32, 64`.
+        signed (bool): Whether the integer type is signed.
+    """
+    assert bits in (8, 16, 32, 64)
+    kind = "i" if signed else "u"
+    return f"<{kind}{bits // 8}"
+
+
 def _deprecated(f_name, new_f):
     @wraps(new_f)
     def new_f_wrapped(*args, **kwargs):
@@ -92,6 +125,29 @@ def kurry(fn):
     return wrapped
 
 
+def buffer_loader(fn):
+    """Mark a deserialize function that accepts any bytes-like object (e.g. `memoryview`), not just `bytes`.
+
+    When reading a dataset, such loaders receive zero-copy views of the data file instead of `bytes` copies.
+    The views must not be kept after the loader returns, because the data file can be modified.
+
+    Example:
+        ```python
+        @buffer_loader
+        def load_u8_array(data):
+            return np.frombuffer(data, np.uint8).copy()
+        ```
+    """
+    fn.buffer_loader = True
+    return fn
+
+
+def is_buffer_loader(loader: Callable) -> bool:
+    """Check if a deserialize function accepts any bytes-like objects, see `buffer_loader`."""
+    fn = loader.func if isinstance(loader, partial) else loader
+    return getattr(fn, "buffer_loader", False)
+
+
 def dump_file(file_path: str) -> bytes:
     """Read raw file contents.
 
@@ -125,14 +181,18 @@ def dump_pil(image, format="JPEG", quality=95, **kwargs) -> bytes:
     return image_bin
 
 
+@buffer_loader
 def load_pil(image_bin: bytes):
-    """Load a Pillow.Image from raw bytes."""
+    """Load a Pillow.Image from raw bytes.
+
+    The image is opened lazily, the pixel data is only decoded when it is
+    accessed (or when `image.load()` is called), so samples that are filtered
+    out are never decoded.
+    """
     from PIL import Image
 
-    with BytesIO(image_bin) as io:
-        image = Image.open(io)
-        image.load()
-    return image
+    # BytesIO owns a copy of views, so the image does not refer to the data file
+    return Image.open(BytesIO(image_bin))
 
 
 @kurry
@@ -149,8 +209,7 @@ def dump_int(n: int, bits: int = 32, signed: bool = True):
             Store in signed format, default: `True`.
     """
 
-    fmt = _get_int_fmt(bits, signed)
-    return struct.pack(fmt, n)
+    return _get_int_struct(bits, signed).pack(n)
 
 
 @kurry
@@ -164,8 +223,7 @@ def dump_float(x: float, bits: int = 32):
         bits (int):
             Bitness of type, valid values are ` 16, 32, 64`, default: `32`.
     """
-    fmt = _get_float_fmt(bits)
-    return struct.pack(fmt, x)
+    return _get_float_struct(bits).pack(x)
 
 
 @kurry
@@ -184,30 +242,32 @@ def dump_str(s: str, encoding: str = "utf-8"):
 @kurry
 def dump_bool(b: bool):
     """Serialize bool data"""
-    return struct.pack("<?", b)
+    return _BOOL_STRUCT.pack(b)
 
 
 @kurry
+@buffer_loader
 def load_bool(b: bool):
     """Deserialize bool data"""
-    return struct.unpack("<?", b)[0]
+    return _BOOL_STRUCT.unpack(b)[0]
 
 
 @kurry
+@buffer_loader
 def load_int(data: bytes, bits: int = 32, signed: bool = True):
     """Deserialize integers, see `io.dump_int` for options."""
-    fmt = _get_int_fmt(bits, signed)
-    return struct.unpack(fmt, data)[0]
+    return _get_int_struct(bits, signed).unpack(data)[0]
 
 
 @kurry
+@buffer_loader
 def load_float(data: bytes, bits: int = 32):
     """Deserialize floats, see `io.dump_float` for options."""
-    fmt = _get_float_fmt(bits)
-    return struct.unpack(fmt, data)[0]
+    return _get_float_struct(bits).unpack(data)[0]
 
 
 @kurry
+@buffer_loader
 def load_str(data: bytes, encoding: str = "utf-8"):
     """Deserialize string data
 
@@ -217,7 +277,65 @@ def load_str(data: bytes, encoding: str = "utf-8"):
     Keyword Args:
         encoding (str): String encoding (default: `utf-8`).
     """
-    return data.decode(encoding)
+    return str(data, encoding)
+
+
+@kurry
+def dump_int_array(xs: List[int], bits: int = 32, signed: bool = True) -> bytes:
+    """Serialize a list of integers at once.
+
+    This is much faster than `dump_list` with `dump_int`, the whole list is packed in a single call.
+
+    Args:
+        xs (List[int]): The integers, or any array-like of integers.
+
+    Keyword Args:
+        bits (int):
+            Bitness of type, valid values are `8, 16, 32, 64`, default: `32`.
+        signed (bool):
+            Store in signed format, default: `True`.
+    """
+    import numpy as np
+
+    return np.asarray(xs, _get_int_dtype(bits, signed)).tobytes()
+
+
+@kurry
+@buffer_loader
+def load_int_array(data: bytes, bits: int = 32, signed: bool = True) -> List[int]:
+    """Deserialize a list of integers, see `io.dump_int_array` for options."""
+    import numpy as np
+
+    return np.frombuffer(data, _get_int_dtype(bits, signed)).tolist()
+
+
+def get_struct_fmt(loader: Callable) -> Optional[str]:
+    """Return the `struct` format of a fixed-size scalar loader.
+
+    Samples whose loaders are all fixed-size scalars (`load_int`, `load_float`, `load_bool`,
+    curried or not) can be decoded with a single `struct` call.
+
+    Args:
+        loader (Callable): The deserialize function.
+
+    Returns:
+        fmt (Optional[str]):
+            The little-endian format of the loader, or `None` if the loader
+            is not a known fixed-size scalar loader.
+    """
+    fn, kwargs = loader, {}
+    if isinstance(loader, partial):
+        fn, kwargs = loader.func, loader.keywords
+    fn = getattr(fn, "__wrapped__", fn)
+    get_fmt = _STRUCT_LOADERS.get(fn)
+    if get_fmt is None:
+        return None
+
+    # Resolve default keyword arguments
+    args = inspect.signature(fn).bind(None, **kwargs)
+    args.apply_defaults()
+    options = list(args.arguments.values())[1:]
+    return get_fmt(*options)
 
 
 def dump_np(x):
@@ -233,6 +351,7 @@ def dump_np(x):
     return bytes
 
 
+@buffer_loader
 def load_np(bs):
     """Deserialize a numpy array."""
     import numpy as np
@@ -242,6 +361,51 @@ def load_np(bs):
     return x
 
 
+def dump_np_raw(x) -> bytes:
+    """Serialize a numpy array without the `.npy` format.
+
+    The array is stored as a compact binary header (dtype, number of dimensions and shape),
+    followed by the raw array data. This is faster than `dump_np`, but object arrays,
+    structured arrays and arrays with more than 8 dimensions are not supported.
+
+    Args:
+        x (np.ndarray): The numpy array to be serialized.
+    """
+    import numpy as np
+
+    x = np.asarray(x)
+    if x.ndim > _NP_RAW_MAX_DIMS:
+        raise ValueError(
+            f"Arrays with more than {_NP_RAW_MAX_DIMS} dimensions are not supported"
+        )
+    if x.dtype.hasobject:
+        raise ValueError("Object arrays are not supported")
+    if x.dtype.names is not None:
+        raise ValueError("Structured arrays are not supported")
+    if len(x.dtype.str) > 16:
+        raise ValueError(
+            f"Dtype {x.dtype.str} is too long, at most 16 characters are supported"
+        )
+
+    shape = [*x.shape, *[0] * (_NP_RAW_MAX_DIMS - x.ndim)]
+    header = _NP_RAW_HEADER_STRUCT.pack(x.dtype.str.encode(), x.ndim, *shape)
+    return header + x.tobytes()
+
+
+def load_np_raw(bs: bytes):
+    """Deserialize a numpy array serialized with `dump_np_raw`.
+
+    The returned array shares memory with `bs` and is therefore read-only,
+    use `.copy()` to get a writable array.
+    """
+    import numpy as np
+
+    dtype, ndim, *shape = _NP_RAW_HEADER_STRUCT.unpack_from(bs)
+    dtype = dtype.rstrip(b"\x00").decode()
+    x = np.frombuffer(bs, dtype, offset=_NP_RAW_HEADER_STRUCT.size)
+    return x.reshape(tuple(shape[:ndim]))
+
+
 def identity(bs: bytes) -> bytes:
     """Does not do anything, incase what you load or save is already in `bytes`.
 
@@ -251,6 +415,28 @@ def identity(bs: bytes) -> bytes:
     return bs
 
 
+@buffer_loader
+def load_view(bs: bytes) -> memoryview:
+    """Like `identity`, but without copying the data when reading a dataset.
+
+    Datasets pass a zero-copy `memoryview` slice of the data file to this loader,
+    which is returned as is. This saves an allocation and a copy per item,
+    which matters for large raw items (encoded images, tensors...).
+
+    !!! warning "The view refers to the data file"
+        The view reflects the data file as it is, so its content changes if the sample
+        is updated in place, or if its space is reused after an update.
+        Datasets never shrink the data file, but shrinking it by other means (e.g. `truncate`)
+        while a view is alive crashes the process (SIGBUS) when the view is read.
+        The data file stays mapped as long as the view is alive.
+        Use `bytes(view)` to keep a copy.
+
+    Args:
+        bs (bytes): Raw bytes, or a view of them.
+    """
+    return bs
+
+
 @kurry
 def dump_list(lst: List[T], dumper: Callable[T, bytes] = None, save_fn=None) -> bytes:
     """Serialize list of arbitrary items.
@@ -267,21 +453,17 @@ def dump_list(lst: List[T], dumper: Callable[T, bytes] = None, save_fn=None) ->
         )
     # Because without length, the deserializer will have to read until read result is empty
     # a while-true loop in a repeatedly called function seems pretty cursed
-    n = len(lst)
-    with BytesIO() as f:
-        length = struct.pack("<L", len(lst))
-        f.write(length)
-        for item in lst:
-            data = dumper(item)
-            header = struct.pack("<L", len(data))
-            f.write(header)
-            f.write(data)
-        f.seek(0)
-        bs = f.read()
-    return bs
+    pack_header = _LIST_HEADER_STRUCT.pack
+    parts = [pack_header(len(lst))]
+    for item in lst:
+        data = dumper(item)
+        parts.append(pack_header(len(data)))
+        parts.append(data)
+    return b"".join(parts)
 
 
 @kurry
+@buffer_loader
 def load_list(data: bytes, loader: Callable[bytes, T] = None, load_fn=None) -> List[T]:
     """Deserialize list of arbitrary items.
 
@@ -297,16 +479,20 @@ def load_list(data: bytes, loader: Callable[bytes, T] = None, load_fn=None) -> L
             DeprecationWarning,
         )
 
-    def wrapped_deserializer(f):
-        # Unsigned long is 4 bit
-        header = f.read(4)
-        (n,) = struct.unpack("<L", header)
-        data = loader(f.read(n))
-        return data
-
-    with BytesIO(data) as f:
-        (length,) = struct.unpack("<L", f.read(4))
-        outputs = [wrapped_deserializer(f) for _ in range(length)]
+    # Unsigned long is 4 bytes
+    unpack_header = _LIST_HEADER_STRUCT.unpack_from
+    header_size = _LIST_HEADER_STRUCT.size
+    copy = not is_buffer_loader(loader)
+    view = memoryview(data)
+    (length,) = unpack_header(view, 0)
+    offset = header_size
+    outputs = []
+    for _ in range(length):
+        (n,) = unpack_header(view, offset)
+        offset = offset + header_size
+        item = view[offset : offset + n]
+        outputs.append(loader(item.tobytes() if copy else item))
+        offset = offset + n
     return outputs
 
 
@@ -333,6 +519,7 @@ def dump_cv2(image, ext: str, flags: Optional[List] = None) -> bytes:
 
 
 @kurry
+@buffer_loader
 def load_cv2(image_bin: bytes, flags: Optional[List] = None):
     """Use `cv2.imdecode` to decode image from bytes.
 
@@ -351,6 +538,13 @@ def load_cv2(image_bin: bytes, flags: Optional[List] = None):
     return image
 
 
+# Fixed-size scalar loaders and their struct formats
+_STRUCT_LOADERS = {
+    load_bool.__wrapped__: lambda: "<?",
+    load_int.__wrapped__: _get_int_fmt,
+    load_float.__wrapped__: _get_float_fmt,
+}
+
 # Deprecated serializers
 
 
@@ -1,11 +1,15 @@
+import os
+import pickle
 import random
 import string
+import struct
+import sys
 import tempfile
 from os import path, remove
 
 import pytest
 
-from dsrecords import IndexedRecordDataset, io, make_dataset
+from dsrecords import IndexedRecordDataset, IndexedRecordDatasetV2, io, make_dataset, v1
 
 tempdir = tempfile.TemporaryDirectory()
 
@@ -80,6 +84,57 @@ def test_example_list_dumpers():
     assert txt_1 == txt_2
 
 
+def test_curried_dumpers():
+    dumper = io.dump_int(bits=16, signed=False)
+    assert dumper(65535) == io.dump_int(65535, bits=16, signed=False)
+    assert io.load_int(dumper(65535), bits=16, signed=False) == 65535
+
+    # Deprecated aliases are curried too
+    with pytest.warns(DeprecationWarning):
+        dumper = io.save_int(bits=16, signed=False)
+    assert dumper(65535) == io.dump_int(65535, bits=16, signed=False)
+
+
+def test_int_array_dumpers():
+    xs = [0, 1, -1, 2**31 - 1, -(2**31)]
+    assert io.load_int_array(io.dump_int_array(xs)) == xs
+    assert io.load_int_array(memoryview(io.dump_int_array(xs))) == xs
+
+    dumper = io.dump_int_array(bits=8, signed=False)
+    loader = io.load_int_array(bits=8, signed=False)
+    xs = list(range(256))
+    assert len(dumper(xs)) == 256
+    assert loader(dumper(xs)) == xs
+    assert loader(dumper([])) == []
+
+
+def test_np_raw_dumpers():
+    import numpy as np
+
+    arrays = [
+        np.random.rand(3, 4, 5).astype("float32"),
+        np.arange(10, dtype=">i8"),
+        np.zeros((0, 3), dtype="uint8"),
+        np.array(1.5),
+        np.random.rand(4, 6)[:, ::2],
+    ]
+    for x in arrays:
+        y = io.load_np_raw(io.dump_np_raw(x))
+        assert y.dtype == x.dtype
+        assert y.shape == x.shape
+        assert np.array_equal(x, y)
+
+    # Unsupported arrays
+    unsupported = [
+        np.zeros(3, dtype=[("a", "<i4"), ("b", "<f4")]),
+        np.array([None, 1], dtype=object),
+        np.zeros([1] * 9),
+    ]
+    for x in unsupported:
+        with pytest.raises(ValueError):
+            io.dump_np_raw(x)
+
+
 def test_quick_removal():
     # Quick removal
     # Don't test with floating points because they are cursed
@@ -219,3 +274,308 @@ def test_partial_take():
         for j in range(3):
             assert data_raw[i][j] == data[i, j]
 
+
+def test_fixed_size_loaders():
+    # +--------------------------------------------+
+    # | Scalar schemas are decoded in a single go, |
+    # | mixed schemas use the generic path         |
+    # +--------------------------------------------+
+    random.seed(0)
+    n = 1000
+    schemas = [
+        (
+            [io.dump_int(bits=16, signed=False), io.dump_float(bits=64), io.dump_bool],
+            [io.load_int(bits=16, signed=False), io.load_float(bits=64), io.load_bool],
+        ),
+        (
+            [io.dump_int, io.dump_str, io.dump_bool],
+            [io.load_int, io.load_str, io.load_bool],
+        ),
+    ]
+    for dumpers, loaders in schemas:
+        data_raw = [
+            [random.randint(0, n), random.randint(0, n) / 4, random.random() > 0.5]
+            for _ in range(n)
+        ]
+        if loaders[1] is io.load_str:
+            data_raw = [[a, str(b), c] for a, b, c in data_raw]
+        name, _ = make_dataset(data_raw, tmpfile(), dumpers)
+        data = IndexedRecordDataset(name, loaders=loaders)
+        assert all(x == y for x, y in zip(data, data_raw))
+        assert all(data[i] == data_raw[i] for i in range(n))
+
+
+def test_iter_prefetch():
+    random.seed(0)
+    n = 1000
+    data_raw = [[random.randint(0, n), str(random.random())] for _ in range(n)]
+    name, _ = make_dataset(data_raw, tmpfile(), [io.dump_int, io.dump_str])
+    data = IndexedRecordDataset(name, loaders=[io.load_int, io.load_str])
+
+    for num_workers, prefetch in [(1, 1), (2, 4), (4, 64)]:
+        samples = list(data.iter_prefetch(num_workers, prefetch))
+        assert samples == data_raw
+
+    # Stop early
+    for i, sample in enumerate(data.iter_prefetch()):
+        if i == 10:
+            break
+    assert sample == data_raw[10]
+
+
+def test_getitems():
+    random.seed(0)
+    n = 500
+    data_raw = [[random.randint(0, n), str(random.random())] for _ in range(n)]
+    name, _ = make_dataset(data_raw, tmpfile(), [io.dump_int, io.dump_str])
+    data = IndexedRecordDataset(name, loaders=[io.load_int, io.load_str])
+
+    idxs = random.sample(range(n), 64)
+    assert data.__getitems__(idxs) == [data_raw[i] for i in idxs]
+    assert data.__getitems__([]) == []
+
+
+def test_index_bounds():
+    data_raw = [[i] for i in range(10)]
+    name, _ = make_dataset(data_raw, tmpfile(), [io.dump_int])
+    data = IndexedRecordDataset(name, loaders=[io.load_int])
+
+    assert data[-1] == data_raw[-1]
+    assert data[-10] == data_raw[0]
+    for idx in [10, -11]:
+        with pytest.raises(IndexError):
+            data[idx]
+        with pytest.raises(IndexError):
+            data.index[idx] = 0
+
+    # Removed slots are out of range
+    data.index.remove_at(9)
+    with pytest.raises(IndexError):
+        data[9]
+    assert data[-1] == data_raw[8]
+    assert data.index.offsets.tolist() == list(data.index)
+    assert len(data.index.offsets) == 9
+
+
+def test_split_layout():
+    name = tmpfile(".rec")
+    data = IndexedRecordDatasetV2(
+        name,
+        create=True,
+        dumpers=[io.dump_int, io.dump_str],
+        loaders=[io.load_int, io.load_str],
+    )
+
+    # Append, partial and batch access
+    n = 1000
+    data_raw = [[i, str(random.random())] for i in range(n)]
+    for sample in data_raw:
+        data.append(sample)
+    assert list(data) == data_raw
+    assert data[n - 1] == data_raw[-1]
+    assert all(data[i, 1] == data_raw[i][1] for i in range(n))
+    assert all(data[i, -1] == data_raw[i][-1] for i in range(n))
+    assert all(data[i, -2] == data_raw[i][0] for i in range(n))
+    with pytest.raises(IndexError):
+        data[0, 2]
+    assert data.__getitems__([3, 1, 2]) == [data_raw[3], data_raw[1], data_raw[2]]
+
+    # Updates, in place and appended
+    data[0] = data_raw[0] = [-1, "x"]
+    data[1] = data_raw[1] = [-2, "x" * 100]
+    assert data[0] == data_raw[0] and data[1] == data_raw[1]
+
+    # Removal, trim and defrag
+    for i in [10, 500, 20]:
+        data.index.remove_at(i)
+        data_raw[i] = data_raw[-1]
+        data_raw.pop()
+    assert list(data) == data_raw
+    data.index.trim(tmpfile(".idx"), replace=True)
+    assert sorted(data) == sorted(data_raw)
+    output, _ = data.defrag(tmpfile(".rec"))
+    defragged = IndexedRecordDatasetV2(output, loaders=[io.load_int, io.load_str])
+    assert list(defragged) == list(data)
+
+    # Fused scalar loaders
+    data = IndexedRecordDatasetV2(
+        tmpfile(".rec"),
+        create=True,
+        dumpers=[io.dump_int, io.dump_float(bits=64)],
+        loaders=[io.load_int, io.load_float(bits=64)],
+    )
+    data_raw = [[i, i / 7] for i in range(100)]
+    for sample in data_raw:
+        data.append(sample)
+    assert list(data) == data_raw
+
+    # Items that do not match the scalar loaders are not decoded
+    name = tmpfile(".rec")
+    data = IndexedRecordDatasetV2(
+        name,
+        create=True,
+        dumpers=[io.identity] * 2,
+        loaders=[io.load_int(bits=16)] * 2,
+    )
+    data.append([b"\x01", b"\x02\x03\x04"])
+    with pytest.raises(struct.error):
+        data[0]
+
+    # The layouts can not be mixed up
+    with pytest.raises(AssertionError):
+        IndexedRecordDataset(output, loaders=[io.load_int, io.load_str])
+
+    # A failed creation does not leave a header file behind
+    with pytest.raises(AssertionError):
+        IndexedRecordDatasetV2(output, create=True)
+    name = tmpfile(".rec")
+    open(name, "wb").close()
+    with pytest.raises(AssertionError):
+        IndexedRecordDatasetV2(name, create=True)
+    assert not path.exists(path.splitext(name)[0] + ".hdr")
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="requires os.fork")
+def test_fork_reset():
+    data_raw = [[i] for i in range(10)]
+    name, _ = make_dataset(data_raw, tmpfile(), [io.dump_int])
+    data = IndexedRecordDataset(name, loaders=[io.load_int])
+    assert data[0] == data_raw[0]
+    assert data._mm is not None
+
+    pid = os.fork()
+    if pid == 0:
+        # Child: the map is dropped, and reopened on access
+        ok = data._mm is None and list(data) == data_raw
+        os._exit(0 if ok else 1)
+    _, status = os.waitpid(pid, 0)
+    assert os.WEXITSTATUS(status) == 0
+    assert data._mm is not None
+
+
+def test_load_view():
+    data_raw = [[bytes([i]) * i, str(i)] for i in range(100)]
+    name, _ = make_dataset(data_raw, tmpfile(), [io.identity, io.dump_str])
+    data = IndexedRecordDataset(name, loaders=[io.load_view, io.load_str])
+
+    for i, (view, s) in enumerate(data):
+        assert isinstance(view, memoryview)
+        assert bytes(view) == data_raw[i][0]
+        assert s == data_raw[i][1]
+    assert data[5, 0] == data_raw[5][0]
+
+
+def test_pickle_after_read():
+    data_raw = [[i, str(i)] for i in range(10)]
+    name, _ = make_dataset(data_raw, tmpfile(), [io.dump_int, io.dump_str])
+    data = IndexedRecordDataset(name, loaders=[io.load_int, io.load_str])
+    assert list(data) == data_raw
+    assert data[3] == data_raw[3]
+    assert data[3, 1] == data_raw[3][1]
+
+    data_ = pickle.loads(pickle.dumps(data))
+    assert list(data_) == data_raw
+    assert data_[3, 1] == data_raw[3][1]
+
+
+def test_read_only_index():
+    data_raw = [[i] for i in range(10)]
+    name, index_name = make_dataset(data_raw, tmpfile(), [io.dump_int])
+    os.chmod(name, 0o444)
+    os.chmod(index_name, 0o444)
+
+    # Reading does not open the index file for writing
+    data = IndexedRecordDataset(name, loaders=[io.load_int])
+    assert list(data) == data_raw
+    assert data[-1] == data_raw[-1]
+    assert not data.index._writable
+
+    # The first modification does
+    os.chmod(index_name, 0o644)
+    data.index.remove_at(0)
+    assert data.index._writable
+    assert data[0] == data_raw[-1]
+
+
+def test_byteswapped_index(monkeypatch):
+    # Pretend to be a big-endian machine, the index file is read
+    # and written through the byteswapping view consistently
+    monkeypatch.setattr(sys, "byteorder", "big")
+    data_raw = [[i] for i in range(100)]
+    name, _ = make_dataset(data_raw, tmpfile(), [io.dump_int])
+    data = IndexedRecordDataset(name, loaders=[io.load_int], dumpers=[io.dump_int])
+    assert list(data) == data_raw
+    assert data.index.offsets.tolist() == list(data.index)
+    data.append([100])
+    assert data[-1] == [100]
+    data.index.remove_at(0)
+    assert data[0] == [100]
+    assert list(data)[1:] == data_raw[1:]
+
+
+def test_update_after_view():
+    name = tmpfile(".rec")
+    data = IndexedRecordDataset(
+        name, create=True, dumpers=[io.identity], loaders=[io.load_view]
+    )
+    for i in range(10):
+        data.append([bytes([i]) * 4096])
+
+    # Shrinking the last sample must not truncate the file under the view
+    view = data[9][0]
+    data[9] = [b"x"]
+    assert len(bytes(view)) == 4096
+    assert bytes(data[9][0]) == b"x"
+
+    # The stale tail is reused by the next append
+    data.append([b"y" * 10])
+    assert bytes(data[10][0]) == b"y" * 10
+    assert [bytes(item) for item, in data][:9] == [bytes([i]) * 4096 for i in range(9)]
+
+
+class PairFormat(v1.RecordFormat):
+    def serialize(self, record):
+        n, s = record
+        return [io.dump_int(n), io.dump_str(s)]
+
+    def deserialize(self, record_bins):
+        n_bin, s_bin = record_bins
+        return [io.load_int(n_bin), io.load_str(s_bin)]
+
+
+def test_v1_dataset():
+    data_raw = [[i, str(i) * (i % 5)] for i in range(100)]
+    record_file = tmpfile(".rec")
+    index_file = tmpfile(".idx")
+    v1.make_dataset(data_raw, record_file, index_file, PairFormat())
+    data = v1.EzRecordDataset(record_file, index_file, PairFormat())
+    assert len(data) == len(data_raw)
+    assert [data[i] for i in range(len(data))] == data_raw
+
+    # Legacy text index files are still supported
+    text_index_file = tmpfile(".idx")
+    with open(text_index_file, "w", encoding="utf-8") as f:
+        for offsets in data.offsets:
+            f.write(",".join(str(i) for i in offsets) + "\n")
+    data = v1.EzRecordDataset(record_file, text_index_file, PairFormat())
+    assert [data[i] for i in range(len(data))] == data_raw
+
+
+def test_multiple_writers():
+    name = tmpfile(".rec")
+    a = IndexedRecordDataset(
+        name, create=True, dumpers=[io.dump_str], loaders=[io.load_str]
+    )
+    a.append(["x"])
+    b = IndexedRecordDataset(name, dumpers=[io.dump_str], loaders=[io.load_str])
+    a.append(["A1"])
+    b.append(["B1"])
+    a.append(["A2"])
+
+    expected = [["x"], ["A1"], ["B1"], ["A2"]]
+    assert list(IndexedRecordDataset(name, loaders=[io.load_str])) == expected
+    assert list(a) == expected
+
+    # Readers reload the length explicitly
+    b.index._reload_length()
+    assert list(b) == expected